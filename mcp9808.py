@@ -13,6 +13,11 @@ REG_DEVIDE_ID = const(7)
 REG_RESOLUTION = const(8)
 
 
+# Expected identification register contents
+_EXPECTED_M_ID = b'\x00T'
+_EXPECTED_D_ID = b'\x04\x00'
+
+
 # Sensor resolution values
 TEMP_RESOLUTION_MIN = const(0) # +0.5 C, refresh rate 30 ms
 TEMP_RESOLUTION_LOW = const(1) # +0.25 C, refresh rate 65 ms
@@ -34,62 +39,215 @@ ALERT_POLARITY_AHIGH = const(1) # Active-high
 ALERT_OUTPUT_COMPARATOR = const(0)
 ALERT_OUTPUT_INTERRUPT = const(1)
 
+
+# Valid argument values, kept as module level tuples so they are not
+# reallocated on every validation
+_VALID_BOUNDARY_REGS = (REG_TEMP_BOUNDARY_LOWER, REG_TEMP_BOUNDARY_UPPER, REG_TEMP_BOUNDARY_CRITICAL)
+_VALID_RESOLUTIONS = (TEMP_RESOLUTION_MIN, TEMP_RESOLUTION_LOW, TEMP_RESOLUTION_AVG, TEMP_RESOLUTION_MAX)
+_VALID_ALERT_SELECTORS = (ALERT_SELECT_ALL, ALERT_SELECT_CRIT)
+_VALID_ALERT_POLARITIES = (ALERT_POLARITY_ALOW, ALERT_POLARITY_AHIGH)
+_VALID_ALERT_OUTPUTS = (ALERT_OUTPUT_COMPARATOR, ALERT_OUTPUT_INTERRUPT)
+
+
+# Config register bit descriptions in LSB order: the config description
+# followed by the descriptions for bit values 0 and 1
+_CFG_MEANINGS = (
+    ("Alert output mode", "Comparator", "Interrupt"),
+    ("Alert polarity", "Active-low", "Active-high"),
+    ("Alert Selector", "All", "Only Critical"),
+    ("Alert enabled", "False", "True"),
+    ("Alert status", "Not asserted", "Asserted as set by mode"),
+    ("Interrupt clear bit", "0", "1"),
+    ("Window [low, high] locked", "Unlocked", "Locked"),
+    ("Critical locked", "Unlocked", "Locked"),
+    ("Shutdown", "False", "True")
+)
+# (byte index, bit mask) within the 2 byte config register for each bit
+_CFG_BITS = tuple((0 if i > 7 else 1, 1 << (i % 8)) for i in range(len(_CFG_MEANINGS)))
+
+
+def _decode_temp(msb, lsb):
+    """
+    Decode the raw temperature register bytes into a two's complement
+    integer value in units of 1/16 degree celsius.
+    """
+    v = ((msb & 0x0f) << 8) | lsb
+    if msb & 0x10:
+        v -= 0x1000
+    return v
+
+
+try:
+    # Use the decoder compiled by the viper code emitter if the firmware has
+    # one. Without a native emitter compiling that module fails with a
+    # SyntaxError, an incompatible .mpy raises a ValueError.
+    from mcp9808_viper import _decode_temp
+except (ImportError, SyntaxError, ValueError):
+    pass
+
+
 class MCP9808(object):
     """
     This class implements an interface to the MCP9808 temprature sensor from
     Microchip.
     """
 
-    def __init__(self, i2c=None, addr=0x18):
+    def __init__(self, i2c=None, addr=0x18, skip_id_check=False):
         """
         Initialize a sensor object on the given I2C bus and accessed by the
         given address.
+        The manufacturer and device identifier check can be skipped to save
+        two I2C transactions if the sensor is known to be present.
         """
         if i2c == None or i2c.__class__ != I2C:
             raise ValueError('I2C object needed as argument!')
         self._i2c = i2c
         self._addr = addr
-        self._check_device()
-
-    def _send(self, buf):
-        """
-        Sends the given bufer object over I2C to the sensor.
-        """
-        if hasattr(self._i2c, "writeto"):
+        # Preallocated register payload buffers to avoid heap allocations on
+        # every I2C transaction
+        self._data1 = bytearray(1)
+        self._data2 = bytearray(2)
+        self._rbuf = bytearray(2) # Returned by read_into()
+        self._tbuf = bytearray(2) # Scratch buffer of get_temp*()
+        # Resolve the I2C flavour once instead of on every transaction
+        if (hasattr(i2c, "readfrom_mem") and hasattr(i2c, "readfrom_mem_into")
+                and hasattr(i2c, "writeto_mem")):
             # Micropython
-            self._i2c.writeto(self._addr, buf)
-        elif hasattr(self._i2c, "send"):
+            self._read_reg = self._read_reg_mem
+            self._read_reg_into = self._read_reg_into_mem
+            self._write_reg = self._write_reg_mem
+        elif hasattr(i2c, "writeto"):
+            # Micropython without memory functions (PyCom)
+            self._alloc_frame_bufs()
+            self._read_reg = self._read_reg_ptr
+            self._read_reg_into = self._read_reg_into_ptr
+            self._write_reg = self._write_reg_ptr
+        elif hasattr(i2c, "send"):
             # PyBoard Micropython
-            self._i2c.send(self._addr, buf)
+            self._alloc_frame_bufs()
+            self._read_reg = self._read_reg_pyb
+            self._read_reg_into = self._read_reg_into_pyb
+            self._write_reg = self._write_reg_pyb
         else:
             raise Exception("Invalid I2C object. Unknown Micropython/platform?")
+        if not skip_id_check:
+            self._check_device()
 
-    def _recv(self, n):
+    def _alloc_frame_bufs(self):
         """
-        Read bytes from the sensor using I2C. The byte count must be specified
-        as an argument.
-        Returns a bytearray containing the result.
+        Preallocate the register pointer and write frame buffers used when
+        register accesses are done as plain I2C writes and reads.
         """
-        if hasattr(self._i2c, "writeto"):
-            # Micropython (PyCom)
-            return self._i2c.readfrom(self._addr, n)
-        elif hasattr(self._i2c, "send"):
-            # PyBoard Micropython
-            return self._i2c.recv(n, self._addr)
-        else:
-            raise Exception("Invalid I2C object. Unknown Micropython/platform?")
+        self._rptr = bytearray(1)
+        self._wbuf2 = bytearray(2)
+        self._wbuf3 = bytearray(3)
+
+    def _frame(self, reg, buf):
+        """
+        Returns a preallocated write frame holding the register pointer
+        followed by the given one or two byte buffer.
+        """
+        b = self._wbuf3 if len(buf) == 2 else self._wbuf2
+        b[0] = reg
+        for i in range(len(buf)):
+            b[i + 1] = buf[i]
+        return b
+
+    def _read_reg_mem(self, reg, n):
+        """
+        Read n bytes from the given register of the sensor using a single
+        combined (repeated start) transaction.
+        Returns a bytes object containing the result.
+        """
+        return self._i2c.readfrom_mem(self._addr, reg, n)
+
+    def _read_reg_into_mem(self, reg, buf):
+        """
+        Read len(buf) bytes from the given register of the sensor into the
+        given buffer using a single combined (repeated start) transaction.
+        """
+        self._i2c.readfrom_mem_into(self._addr, reg, buf)
+
+    def _write_reg_mem(self, reg, buf):
+        """
+        Write the given buffer to the given register of the sensor.
+        """
+        self._i2c.writeto_mem(self._addr, reg, buf)
+
+    def _read_reg_ptr(self, reg, n):
+        """
+        Read n bytes from the given register of the sensor by setting the
+        register pointer and reading in a second transaction.
+        Returns a bytes object containing the result.
+        """
+        self._rptr[0] = reg
+        self._i2c.writeto(self._addr, self._rptr)
+        return self._i2c.readfrom(self._addr, n)
+
+    def _read_reg_into_ptr(self, reg, buf):
+        """
+        Read len(buf) bytes from the given register of the sensor into the
+        given buffer by setting the register pointer and reading in a second
+        transaction.
+        """
+        self._rptr[0] = reg
+        self._i2c.writeto(self._addr, self._rptr)
+        self._i2c.readfrom_into(self._addr, buf)
+
+    def _write_reg_ptr(self, reg, buf):
+        """
+        Write the given one or two byte buffer to the given register of the
+        sensor, sending the register pointer and data in one frame.
+        """
+        self._i2c.writeto(self._addr, self._frame(reg, buf))
+
+    def _read_reg_pyb(self, reg, n):
+        """
+        Read n bytes from the given register of the sensor by setting the
+        register pointer and reading in a second transaction.
+        Returns a bytes object containing the result.
+        """
+        self._rptr[0] = reg
+        self._i2c.send(self._rptr, self._addr)
+        return self._i2c.recv(n, self._addr)
+
+    def _read_reg_into_pyb(self, reg, buf):
+        """
+        Read len(buf) bytes from the given register of the sensor into the
+        given buffer by setting the register pointer and reading in a second
+        transaction.
+        """
+        self._rptr[0] = reg
+        self._i2c.send(self._rptr, self._addr)
+        self._i2c.recv(buf, self._addr)
+
+    def _write_reg_pyb(self, reg, buf):
+        """
+        Write the given one or two byte buffer to the given register of the
+        sensor, sending the register pointer and data in one frame.
+        """
+        self._i2c.send(self._frame(reg, buf), self._addr)
+
+    def _update_reg(self, reg, mask, value):
+        """
+        Read-modify-write a 16 bit register: the bits selected by mask are
+        replaced by the corresponding bits of value.
+        """
+        cur = self._read_reg(reg, 2)
+        b = self._data2
+        b[0] = (cur[0] & ~(mask >> 8)) | (value >> 8)
+        b[1] = (cur[1] & ~(mask & 0xFF)) | (value & 0xFF)
+        self._write_reg(reg, b)
 
     def _check_device(self):
         """
         Tries to identify the manufacturer and device identifiers.
         """
-        self._send(REG_MANUFACTURER_ID)
-        self._m_id = self._recv(2)
-        if not self._m_id == b'\x00T':
+        self._m_id = self._read_reg(REG_MANUFACTURER_ID, 2)
+        if self._m_id != _EXPECTED_M_ID:
             raise Exception("Invalid manufacturer ID: '%s'!" % self._m_id)
-        self._send(REG_DEVIDE_ID)
-        self._d_id = self._recv(2)
-        if not self._d_id == b'\x04\x00':
+        self._d_id = self._read_reg(REG_DEVIDE_ID, 2)
+        if self._d_id != _EXPECTED_D_ID:
             raise Exception("Invalid device or revision ID: '%s'!" % self._d_id)
 
     def set_shutdown_mode(self, shdn=True):
@@ -97,18 +255,9 @@ class MCP9808(object):
         Set sensor into shutdown mode to draw less than 1 uA and disable
         continous temperature conversion.
         """
-        if shdn.__class__ != bool:
+        if not isinstance(shdn, bool):
             raise ValueError('Boolean argument needed to set shutdown mode!')
-        self._send(REG_CONFIG)
-        cfg = self._recv(2)
-        b = bytearray()
-        b.append(REG_CONFIG)
-        if shdn:
-            b.append(cfg[0] | 1)
-        else:
-            b.append(cfg[0] & ~1)
-        b.append(cfg[1])
-        self._send(b)
+        self._update_reg(REG_CONFIG, 0x0100, 0x0100 if shdn else 0)
 
     def set_alert_mode(self, enable_alert=True, output_mode=ALERT_OUTPUT_INTERRUPT, polarity=ALERT_POLARITY_ALOW, selector=ALERT_SELECT_ALL):
         """
@@ -118,107 +267,104 @@ class MCP9808(object):
         If output mode is set to interrupt, a call to acknowledge_alert_irq()
         is required to deassert the MCP9808
         """
-        if enable_alert.__class__ != bool:
+        if not isinstance(enable_alert, bool):
             raise ValueError('Boolean argument needed to set alert mode!')
-        if output_mode not in [ALERT_OUTPUT_COMPARATOR, ALERT_OUTPUT_INTERRUPT]:
+        if output_mode not in _VALID_ALERT_OUTPUTS:
             raise ValueError("Invalid output mode set.")
-        if selector not in [ALERT_SELECT_ALL, ALERT_SELECT_CRIT]:
+        if selector not in _VALID_ALERT_SELECTORS:
             raise ValueError("Invalid alert selector set.")
-        if polarity not in [ALERT_POLARITY_ALOW, ALERT_POLARITY_AHIGH]:
+        if polarity not in _VALID_ALERT_POLARITIES:
             raise ValueError("Invalid alert polarity set.")
-        
-        enable_alert = 1 if enable_alert else 0 
-        self._send(REG_CONFIG)
-        cfg = self._recv(2)
 
-        alert_bits = (output_mode | (polarity << 1) | (selector << 2) | (enable_alert << 3)) & 0xF
-        lsb_data = (cfg[1] & 0xF0) | alert_bits
-
-        b = bytearray()
-        b.append(REG_CONFIG)
-        b.append(cfg[0])
-        b.append(lsb_data)
-        self._send(b)
+        # All inputs are validated single bits (bool is an int), so the alert
+        # bits can be composed directly
+        alert_bits = output_mode | (polarity << 1) | (selector << 2) | (enable_alert << 3)
+        self._update_reg(REG_CONFIG, 0x000F, alert_bits)
 
     def acknowledge_alert_irq(self):
         """
         Must be called if MCP9808 is operating in interrupt output mode
         """
-        self._send(REG_CONFIG)
-        cfg = self._recv(2)
-        b = bytearray()
-        b.append(REG_CONFIG)
-        b.append(cfg[0]) # MSB data
-        b.append(cfg[1] | 0x20) # LSB data with interrupt clear bit set
-        self._send(b)  
+        self._update_reg(REG_CONFIG, 0x0020, 0x0020) # Interrupt clear bit
 
     def set_alert_boundary_temp(self, boundary_register, value):
         """
         Sets the alert boundary for the requested boundary register
         """
-        if boundary_register not in [REG_TEMP_BOUNDARY_LOWER, REG_TEMP_BOUNDARY_UPPER, REG_TEMP_BOUNDARY_CRITICAL]:
+        if boundary_register not in _VALID_BOUNDARY_REGS:
             raise ValueError("Given alert boundary register is not valid!")
         if value < -128 or value > 127: # 8 bit two's complement
             raise ValueError("Temperature out of range [-128, 127]")
+        # The register has a resolution of 0.25 C, truncate towards zero
+        self._write_alert_boundary(boundary_register, int(value * 4))
+
+    def set_alert_boundary_temp_q2(self, boundary_register, value):
+        """
+        Sets the alert boundary for the requested boundary register from an
+        integer value in units of 0.25 C (degree celsius multiplied by 4).
+        This method does avoid floating point arithmetic completely.
+        """
+        if boundary_register not in _VALID_BOUNDARY_REGS:
+            raise ValueError("Given alert boundary register is not valid!")
+        if value < -512 or value > 508:
+            raise ValueError("Temperature out of range [-512, 508]")
+        self._write_alert_boundary(boundary_register, value)
 
-        integral = int(value)
-        frac = abs(value - integral)
-        if integral < 0:
-            integral = (1 << 9) + integral
-        integral = ((integral & 0x1FF) << 4) 
-        frac = (((1 if frac * 2 >= 1 else 0) << 1) + (1 if (frac * 2 - int(frac * 2)) * 2 >= 1 else 0)) << 2
-        twos_value = (integral + frac if value >= 0 else integral - frac) & 0x1ffc 
-        b = bytearray()
-        b.append(boundary_register)
-        b.append((twos_value & 0xFF00) >> 8)
-        b.append(twos_value & 0xFF)
-        self._send(b)
-        
+    def _write_alert_boundary(self, boundary_register, value):
+        """
+        Writes an already validated alert boundary value in units of 0.25 C
+        to the given boundary register.
+        """
+        # 11 bit two's complement value in bits 12-2 of the register
+        twos_value = (value << 2) & 0x1FFC
+        b = self._data2
+        b[0] = twos_value >> 8
+        b[1] = twos_value & 0xFF
+        self._write_reg(boundary_register, b)
 
     def set_resolution(self, r):
         """
         Sets the temperature resolution.
         """
-        if r not in [TEMP_RESOLUTION_MIN, TEMP_RESOLUTION_LOW, TEMP_RESOLUTION_AVG, TEMP_RESOLUTION_MAX]:
+        if r not in _VALID_RESOLUTIONS:
             raise ValueError('Invalid temperature resolution requested!')
-        b = bytearray()
-        b.append(REG_RESOLUTION)
-        b.append(r)
-        self._send(b)
+        b = self._data1
+        b[0] = r
+        self._write_reg(REG_RESOLUTION, b)
+
+    def read_into(self, buf=None):
+        """
+        Read the raw 2 byte temperature register into the given buffer, or
+        into an internal buffer if none is given, without allocating memory.
+        Returns the buffer. The internal buffer is only overwritten by the
+        next read_into() call, get_temp() and get_temp_int() use their own.
+        """
+        if buf is None:
+            buf = self._rbuf
+        self._read_reg_into(REG_TEMP, buf)
+        return buf
 
     def get_temp(self):
         """
         Read temperature in degree celsius and return float value.
         """
-        self._send(REG_TEMP)
-        raw = self._recv(2)
-        u = (raw[0] & 0x0f) << 4
-        l = raw[1] / 16
-        if raw[0] & 0x10 == 0x10:
-            temp = (u + l) - 256
-        else:
-            temp = u + l
-        return temp
+        raw = self._tbuf
+        self._read_reg_into(REG_TEMP, raw)
+        return _decode_temp(raw[0], raw[1]) * 0.0625
 
     def get_temp_int(self):
         """
         Read a temperature in degree celsius and return a tuple of two parts.
-        The first part is the decimal part and the second the fractional part
-        of the value.
+        The first part is the decimal part (rounded down) and the second the
+        non-negative fractional part of the value in hundredths, so that the
+        temperature equals decimal + fraction / 100.
         This method does avoid floating point arithmetic completely to support
         platforms missing float support.
         """
-        self._send(REG_TEMP)
-        raw = self._recv(2)
-        u = (raw[0] & 0xf) << 4
-        l = raw[1] >> 4
-        if raw[0] & 0x10 == 0x10:
-            temp = (u + l) - 256
-            frac = -((raw[1] & 0x0f) * 100 >> 4)
-        else:
-            temp = u + l
-            frac = (raw[1] & 0x0f) * 100 >> 4
-        return temp, frac
+        raw = self._tbuf
+        self._read_reg_into(REG_TEMP, raw)
+        v = _decode_temp(raw[0], raw[1])
+        return v >> 4, (v & 0x0f) * 100 >> 4
 
     def _debug_config(self, cfg=None):
         """
@@ -226,25 +372,10 @@ class MCP9808(object):
         readable descriptions
         """
         if not cfg:
-            self._send(REG_CONFIG)
-            cfg = self._recv(2)
-        
-        # meanings[a][b] with a the bit index (LSB order),
-        # b=0 the config description and b={bit value}+1 the value description 
-        meanings = [
-            ["Alert output mode", "Comparator", "Interrupt"],
-            ["Alert polarity", "Active-low", "Active-high"],
-            ["Alert Selector", "All", "Only Critical"],
-            ["Alert enabled", "False", "True"],
-            ["Alert status", "Not asserted", "Asserted as set by mode"],
-            ["Interrupt clear bit", "0", "1"],
-            ["Window [low, high] locked", "Unlocked", "Locked"],
-            ["Critical locked", "Unlocked", "Locked"],
-            ["Shutdown", "False", "True"]
-        ]
+            cfg = self._read_reg(REG_CONFIG, 2)
 
         print("Raw config: {}".format(str(cfg)))
-        for i in range(0, min(len(meanings), len(cfg)*8)):
-            part = 0 if i > 7 else 1
-            value = 1 if (cfg[part] & (2**(i % 8))) > 0 else 0
-            print(meanings[i][0] + ": " + meanings[i][1 + value])
\ No newline at end of file
+        for i in range(min(len(_CFG_MEANINGS), len(cfg) * 8)):
+            name, v0, v1 = _CFG_MEANINGS[i]
+            part, mask = _CFG_BITS[i]
+            print(name + ": " + (v1 if cfg[part] & mask else v0))
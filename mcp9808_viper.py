@@ -0,0 +1,16 @@
+# Temperature decoder for the mcp9808 module, compiled by the viper code
+# emitter. This module only compiles on firmware with a native emitter,
+# mcp9808 falls back to its own pure Python decoder otherwise.
+import micropython
+
+
+@micropython.viper
+def _decode_temp(msb: int, lsb: int) -> int:
+    """
+    Decode the raw temperature register bytes into a two's complement
+    integer value in units of 1/16 degree celsius.
+    """
+    v = ((msb & 0x0f) << 8) | lsb
+    if msb & 0x10:
+        v -= 0x1000
+    return v